@@ -1,16 +1,25 @@
 from __future__ import annotations
 
 import os
-import re
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime
-from enum import Enum
-from typing import Dict, List, Optional
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 
+from .laboral_core import (
+    RUTAS_OPERATIVAS,
+    classify,
+    corresponde_a_laboral,
+    missing_field_flags,
+    normalize,
+    route_operativa,
+)
+
 
 # -----------------------------
 # Cargar .env
@@ -43,18 +52,22 @@ HARDCODED_GENERAL_CASES: Dict[str, Dict[str, str]] = {
 # -----------------------------
 # Estados y modelo simple (en memoria)
 # -----------------------------
-class CaseState(str, Enum):
-    RECEIVED = "RECEIVED"
-    DETAILS_CAPTURED = "DETAILS_CAPTURED"
-    DOCS_REQUESTED = "DOCS_REQUESTED"
-    DOCS_RECEIVED = "DOCS_RECEIVED"
-    VALIDATED = "VALIDATED"
-    PRE_CLASSIFIED = "PRE_CLASSIFIED"
-    EXPEDIENTE_GENERATED = "EXPEDIENTE_GENERATED"
-    HANDOFF_TO_HUMAN = "HANDOFF_TO_HUMAN"
-
-
-@dataclass
+class CaseState(IntEnum):
+    RECEIVED = 0
+    DETAILS_CAPTURED = 1
+    DOCS_REQUESTED = 2
+    DOCS_RECEIVED = 3
+    VALIDATED = 4
+    PRE_CLASSIFIED = 5
+    EXPEDIENTE_GENERATED = 6
+    HANDOFF_TO_HUMAN = 7
+
+
+# Nombre de cada estado indexado por su valor (solo para las respuestas de las tools)
+_STATE_NAMES = tuple(s.name for s in CaseState)
+
+
+@dataclass(slots=True)
 class DocumentChecklistItem:
     doc: str
     requerido: bool = False
@@ -62,7 +75,7 @@ class DocumentChecklistItem:
     nota: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class CaseData:
     # Nota: TODO lo digita el OPERADOR (no el usuario final en el sistema)
     nombre: Optional[str] = None
@@ -86,19 +99,51 @@ class CaseData:
     jurisdiccion_probable: Optional[str] = None
     banderas: List[str] = field(default_factory=list)
 
+    @property
+    def relato_total(self) -> str:
+        return (self.relato or "") + ("\n" + self.relato_extra if self.relato_extra else "")
 
-@dataclass
+
+@dataclass(slots=True)
 class CaseRecord:
     case_id: str
     state: CaseState = CaseState.RECEIVED
-    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
-    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
     data: CaseData = field(default_factory=CaseData)
     checklist: Dict[str, DocumentChecklistItem] = field(default_factory=dict)
     expediente: Optional[str] = None
 
+    def __post_init__(self) -> None:
+        # Un solo timestamp para ambos campos al crear el caso
+        if self.created_at is None or self.updated_at is None:
+            now = datetime.utcnow().isoformat() + "Z"
+            self.created_at = self.created_at or now
+            self.updated_at = self.updated_at or now
+
+
+MAX_CASES = max(1, int(os.getenv("LABORAL_MAX_CASES", "1000")))
+
+
+class _CaseDB(OrderedDict[str, CaseRecord]):
+    # CASE_DB[cid] crea el caso si no existe; usar .get() cuando debe existir.
+    # Orden LRU: al superar MAX_CASES se descarta el caso usado hace más tiempo.
+    def __getitem__(self, cid: str) -> CaseRecord:
+        c = super().__getitem__(cid)
+        self.move_to_end(cid)
+        return c
+
+    def __missing__(self, cid: str) -> CaseRecord:
+        c = self[cid] = CaseRecord(case_id=cid)
+        return c
 
-CASE_DB: Dict[str, CaseRecord] = {}
+    def __setitem__(self, cid: str, c: CaseRecord) -> None:
+        super().__setitem__(cid, c)
+        while len(self) > MAX_CASES:
+            self.popitem(last=False)
+
+
+CASE_DB: _CaseDB = _CaseDB()
 
 
 # -----------------------------
@@ -126,90 +171,72 @@ DOCUMENTOS_BASE = [
     "Reportes (si existen)",
 ]
 
-LABORAL_KEYWORDS = [
-    "empleador", "salario", "pago", "despido", "jornada",
-    "prestaciones", "contrato", "trabaj", "incapacidad", "accidente"
-]
-PENAL_SIGNALS = [
-    "amenaza de muerte", "arma", "secuestro", "extorsión", "agresión sexual"
-]
+# -----------------------------
+# TOOLS (el operador llena todo)
+# -----------------------------
+def _ok(cid: str, state: CaseState, **extra: Any) -> dict:
+    return {"status": "ok", "case_id": cid, "state": _STATE_NAMES[state], **extra}
 
 
-def _normalize(text: str) -> str:
-    return re.sub(r"\s+", " ", (text or "").strip().lower())
+def _err(msg: str) -> dict:
+    return {"status": "error", "error_message": msg}
 
 
-def corresponde_a_laboral(relato_total: str) -> bool:
-    t = _normalize(relato_total)
-    if any(s in t for s in PENAL_SIGNALS):
-        return False
-    return any(k in t for k in LABORAL_KEYWORDS)
+def _get_case(case_id: str) -> Tuple[str, Optional[CaseRecord]]:
+    cid = case_id.upper()
+    c = CASE_DB.get(cid)
+    if c:
+        CASE_DB.move_to_end(cid)
+    return cid, c
 
 
-def route_operativa(relato_total: str) -> str:
-    t = _normalize(relato_total)
-    if any(s in t for s in PENAL_SIGNALS):
-        return "PENAL (probable) — derivación sugerida, revisión humana obligatoria"
-    if any(k in t for k in LABORAL_KEYWORDS):
-        return "LABORAL (probable) — pre-clasificación operativa, revisión humana final"
-    return "REVISAR (humano) — información insuficiente para ruta operativa"
+def _fresh_checklist() -> Dict[str, DocumentChecklistItem]:
+    return {doc: DocumentChecklistItem(doc=doc) for doc in DOCUMENTOS_BASE}
 
 
-# -----------------------------
-# TOOLS (el operador llena todo)
-# -----------------------------
 def create_case(case_id: Optional[str] = None) -> dict:
     cid = (case_id or "LAB-0001").upper()
-    if cid not in CASE_DB:
-        CASE_DB[cid] = CaseRecord(case_id=cid)
-    return {"status": "ok", "case_id": cid, "state": CASE_DB[cid].state.value}
+    return _ok(cid, CASE_DB[cid].state)
 
 
 def capture_identity(case_id: str, dui: str, nombre: str, contacto: str) -> dict:
     cid = case_id.upper()
-    if cid not in CASE_DB:
-        CASE_DB[cid] = CaseRecord(case_id=cid)
     c = CASE_DB[cid]
     c.data.dui = dui
     c.data.nombre = nombre
     c.data.contacto = contacto
     c.state = CaseState.DETAILS_CAPTURED
-    return {"status": "ok", "case_id": cid, "state": c.state.value}
+    return _ok(cid, c.state)
 
 
 def pull_story_from_general(case_id: str) -> dict:
     cid = case_id.upper()
-    if cid not in CASE_DB:
-        CASE_DB[cid] = CaseRecord(case_id=cid)
-
     c = CASE_DB[cid]
     hard = HARDCODED_GENERAL_CASES.get(cid)
     if not hard:
-        return {"status": "error", "error_message": "No hay relato quemado para ese case_id (usa LAB-0001 o LAB-0002)."}
+        return _err("No hay relato quemado para ese case_id (usa LAB-0001 o LAB-0002).")
 
     c.data.relato = hard["relato"]
     c.state = CaseState.DETAILS_CAPTURED
 
-    return {
-        "status": "ok",
-        "case_id": cid,
-        "formato": {
+    return _ok(
+        cid,
+        c.state,
+        formato={
             "nombre_persona": c.data.nombre or "N/D",
             "dui": c.data.dui or "N/D",
             "relato": c.data.relato,
         },
-        "state": c.state.value,
-    }
+    )
 
 
 def add_more_info(case_id: str, info_adicional: str) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
     c.data.relato_extra = info_adicional
     c.state = CaseState.DETAILS_CAPTURED
-    return {"status": "ok", "case_id": cid, "state": c.state.value}
+    return _ok(cid, c.state)
 
 
 def capture_required_fields(
@@ -222,10 +249,9 @@ def capture_required_fields(
     fecha_despido_ultimo_pago: str,
     pretension: str,
 ) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
 
     d = c.data
     d.empleador_nombre = empleador_nombre
@@ -236,99 +262,80 @@ def capture_required_fields(
     d.fecha_despido_ultimo_pago = fecha_despido_ultimo_pago
     d.pretension = pretension
     c.state = CaseState.DETAILS_CAPTURED
-    return {"status": "ok", "case_id": cid, "state": c.state.value}
+    return _ok(cid, c.state)
 
 
 def request_documents(case_id: str) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
 
-    c.checklist = {doc: DocumentChecklistItem(doc=doc, requerido=False, recibido=False) for doc in DOCUMENTOS_BASE}
+    c.checklist = _fresh_checklist()
     c.state = CaseState.DOCS_REQUESTED
-    return {
-        "status": "ok",
-        "case_id": cid,
-        "documentos_base": [{"doc": d.doc, "recibido": d.recibido} for d in c.checklist.values()],
-        "state": c.state.value,
-        "nota": "No son obligatorios, pero se solicitan si existen.",
-    }
+    return _ok(
+        cid,
+        c.state,
+        documentos_base=[{"doc": d.doc, "recibido": d.recibido} for d in c.checklist.values()],
+        nota="No son obligatorios, pero se solicitan si existen.",
+    )
 
 
 def mark_document(case_id: str, doc_name: str, existe: bool, nota: Optional[str] = None) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
-
-    if not c.checklist:
-        c.checklist = {doc: DocumentChecklistItem(doc=doc) for doc in DOCUMENTOS_BASE}
+        return _err("case_id no encontrado.")
 
-    item = c.checklist.get(doc_name) or DocumentChecklistItem(doc=doc_name)
+    item = c.checklist.get(doc_name)
+    if item is None:
+        item = c.checklist[doc_name] = DocumentChecklistItem(doc=doc_name)
     item.recibido = bool(existe)
     if nota:
         item.nota = nota
-    c.checklist[doc_name] = item
 
     c.state = CaseState.DOCS_RECEIVED
-    return {"status": "ok", "case_id": cid, "doc": doc_name, "existe": existe, "state": c.state.value}
+    return _ok(cid, c.state, doc=doc_name, existe=existe)
 
 
 def validate_and_recheck(case_id: str) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
 
     d = c.data
-    flags: List[str] = []
-
-    if not d.nombre: flags.append("Falta nombre.")
-    if not d.dui: flags.append("Falta DUI.")
-    if not d.contacto: flags.append("Falta contacto.")
-    if not d.empleador_nombre: flags.append("Falta empleador (nombre).")
-    if not d.cargo: flags.append("Falta cargo.")
-    if not d.salario_monto or not d.salario_periodicidad: flags.append("Falta salario (monto/periodicidad).")
-    if not d.fecha_inicio: flags.append("Falta fecha inicio relación.")
-    if not d.fecha_despido_ultimo_pago: flags.append("Falta fecha despido/último pago.")
-    if not d.relato: flags.append("Falta relato base (del agente general).")
-    if not d.pretension: flags.append("Falta pretensión.")
-
-    relato_total = (d.relato or "") + ("\n" + d.relato_extra if d.relato_extra else "")
-    if any(s in _normalize(relato_total) for s in PENAL_SIGNALS):
+    flags = missing_field_flags(d)
+
+    clase = classify(normalize(d.relato_total))
+    if clase == "PENAL":
         flags.append("Señales de posible materia penal (solo derivación sugerida).")
 
     d.banderas = flags
     c.state = CaseState.VALIDATED
 
-    is_laboral = corresponde_a_laboral(relato_total)
-    d.jurisdiccion_probable = route_operativa(relato_total)
+    is_laboral = clase == "LABORAL"
+    d.jurisdiccion_probable = RUTAS_OPERATIVAS[clase]
     c.state = CaseState.PRE_CLASSIFIED
 
-    return {
-        "status": "ok",
-        "case_id": cid,
-        "flags": flags,
-        "jurisdiccion_probable": d.jurisdiccion_probable,
-        "corresponde_a_laboral_probable": is_laboral,
-        "state": c.state.value,
-    }
+    return _ok(
+        cid,
+        c.state,
+        flags=flags,
+        jurisdiccion_probable=d.jurisdiccion_probable,
+        corresponde_a_laboral_probable=is_laboral,
+    )
 
 
 def generate_expediente(case_id: str) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
 
     d = c.data
-    relato_total = (d.relato or "") + ("\n" + d.relato_extra if d.relato_extra else "")
+    relato_total = d.relato_total
 
     docs_lines = []
     for doc in DOCUMENTOS_BASE:
-        item = c.checklist.get(doc) if c.checklist else None
-        ok = (item.recibido if item else False)
+        item = c.checklist.get(doc)
+        ok = item.recibido if item else False
         note = f" ({item.nota})" if (item and item.nota) else ""
         docs_lines.append(f"- {'✅' if ok else '▫️'} {doc}{note}")
 
@@ -366,21 +373,23 @@ def generate_expediente(case_id: str) -> dict:
 
     c.expediente = expediente
     c.state = CaseState.EXPEDIENTE_GENERATED
-    return {"status": "ok", "case_id": cid, "expediente": expediente, "state": c.state.value}
+    return _ok(cid, c.state, expediente=expediente)
 
 
 def handoff_to_human(case_id: str, nota: Optional[str] = None) -> dict:
-    cid = case_id.upper()
-    c = CASE_DB.get(cid)
+    cid, c = _get_case(case_id)
     if not c:
-        return {"status": "error", "error_message": "case_id no encontrado."}
+        return _err("case_id no encontrado.")
     c.state = CaseState.HANDOFF_TO_HUMAN
-    return {"status": "ok", "case_id": cid, "state": c.state.value, "nota": nota or ""}
+    return _ok(cid, c.state, nota=nota or "")
 
 
 # -----------------------------
 # INSTRUCTION (enfoque correcto: el agente guía al OPERADOR)
 # -----------------------------
+_OBLIG_BLOCK = "\n".join(f"- {x}" for x in OBLIGATORIOS_CAPTURA)
+_DOCS_BLOCK = "\n".join(f"- {x}" for x in DOCUMENTOS_BASE)
+
 INSTRUCTION = f"""
 Eres el Agente Laboral para USO INTERNO.
 Importante: la PERSONA usuaria NO escribe en el sistema. Quien escribe es el OPERADOR.
@@ -421,7 +430,7 @@ C) Complemento del relato
 
 D) Captura obligatoria (operador pregunta y digita)
 6) Indícale al OPERADOR que pregunte y anote:
-{chr(10).join([f"- {x}" for x in OBLIGATORIOS_CAPTURA])}
+{_OBLIG_BLOCK}
    Luego guarda con capture_required_fields(...).
 
 E) Documentos (no obligatorios, pero pedir si existen)
@@ -430,7 +439,7 @@ E) Documentos (no obligatorios, pero pedir si existen)
    “¿Cuenta con este documento o evidencia?”
    y que te responda Sí/No. Marca con mark_document(case_id, doc_name, existe).
 Lista:
-{chr(10).join([f"- {x}" for x in DOCUMENTOS_BASE])}
+{_DOCS_BLOCK}
 
 F) Validación y revisión operativa
 9) Ejecuta validate_and_recheck(case_id) y explica el resultado al OPERADOR.
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# -----------------------------
+# Núcleo de pre-clasificación y validación (sin dependencias de ADK).
+# Solo usa str/dict/tuple tipados, así que se puede compilar con mypyc
+# (`mypyc laboral_core.py`); agent.py lo importa igual compilado o no.
+# -----------------------------
+
+# Campos de CaseData que deben estar llenos (todos los del grupo) y su bandera
+REQUIRED_FIELDS: Tuple[Tuple[Tuple[str, ...], str], ...] = (
+    (("nombre",), "Falta nombre."),
+    (("dui",), "Falta DUI."),
+    (("contacto",), "Falta contacto."),
+    (("empleador_nombre",), "Falta empleador (nombre)."),
+    (("cargo",), "Falta cargo."),
+    (("salario_monto", "salario_periodicidad"), "Falta salario (monto/periodicidad)."),
+    (("fecha_inicio",), "Falta fecha inicio relación."),
+    (("fecha_despido_ultimo_pago",), "Falta fecha despido/último pago."),
+    (("relato",), "Falta relato base (del agente general)."),
+    (("pretension",), "Falta pretensión."),
+)
+
+# Raíces: se buscan como subcadena ("subcontrato", "extrabajador", "salario/mes" cuentan)
+LABORAL_KEYWORDS = [
+    "empleador", "salario", "pago", "despido", "jornada",
+    "prestaciones", "contrato", "trabaj", "incapacidad", "accidente"
+]
+PENAL_SIGNALS = [
+    "amenaza de muerte", "arma", "secuestro", "extorsión", "agresión sexual"
+]
+# Un solo patrón para ambas listas. LABORAL va en lookahead para no consumir texto:
+# así una raíz laboral pegada a una señal penal ("jornadarma") no la oculta.
+_CLASIFICADOR_RE = re.compile(
+    "(?P<pen>" + "|".join(re.escape(s) for s in PENAL_SIGNALS) + ")"
+    "|(?=(?P<lab>" + "|".join(re.escape(k) for k in LABORAL_KEYWORDS) + "))"
+)
+
+
+def normalize(text: str) -> str:
+    # split() sin separador recorta y colapsa espacios en C; no hace falta regex
+    return " ".join((text or "").lower().split())
+
+
+def classify(t: str) -> Optional[str]:
+    # Una sola pasada: PENAL gana en cuanto aparece, LABORAL solo si no hubo PENAL
+    laboral = False
+    for m in _CLASIFICADOR_RE.finditer(t):
+        if m.group("pen") is not None:
+            return "PENAL"
+        laboral = True
+    return "LABORAL" if laboral else None
+
+
+RUTAS_OPERATIVAS: Dict[Optional[str], str] = {
+    "PENAL": "PENAL (probable) — derivación sugerida, revisión humana obligatoria",
+    "LABORAL": "LABORAL (probable) — pre-clasificación operativa, revisión humana final",
+    None: "REVISAR (humano) — información insuficiente para ruta operativa",
+}
+
+
+def corresponde_a_laboral_norm(norm: str) -> bool:
+    return classify(norm) == "LABORAL"
+
+
+def route_operativa_norm(norm: str) -> str:
+    return RUTAS_OPERATIVAS[classify(norm)]
+
+
+def corresponde_a_laboral(relato_total: str) -> bool:
+    return corresponde_a_laboral_norm(normalize(relato_total))
+
+
+def route_operativa(relato_total: str) -> str:
+    return route_operativa_norm(normalize(relato_total))
+
+
+def missing_field_flags(d: object) -> List[str]:
+    return [msg for attrs, msg in REQUIRED_FIELDS if not all(getattr(d, a) for a in attrs)]